@@ -1,6 +1,7 @@
 import pandas as pd
-import os
-import re
+from energy_utils import (
+    read_meter_csvs, building_id_from_filename, combine_meter_frames, building_labels, bucket_sum, summarize
+)
 
 # --- Data Ingestion (Simplified and Robust) ---
 
@@ -10,53 +11,49 @@ def ingest_data_for_aggregation(data_directory='data'):
     for aggregation tasks. This uses the robust logic developed previously.
     """
     all_dfs = []
+    file_buildings = [] # building name of each frame in all_dfs
     
     print("--- Running Ingestion to Create Master DataFrame ---")
     
     try:
-        for filename in os.listdir(data_directory):
-            if filename.endswith('.csv'):
-                file_path = os.path.join(data_directory, filename)
+        for filename, pending_read in read_meter_csvs(data_directory).items():
+            try:
+                df, short_lines = pending_read.result()
                 
-                try:
-                    df = pd.read_csv(
-                        file_path,
-                        dtype={'kwh': float},
-                        on_bad_lines='skip' 
-                    )
-                    
-                    if len(df) == 0:
-                        continue
-
-                    # Robust Timestamp Conversion and Cleanup
-                    if 'timestamp' in df.columns:
-                        original_len = len(df)
-                        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                        df.dropna(subset=['timestamp'], inplace=True)
-                        if len(df) < original_len:
-                            print(f"  -- LOG: Dropped {original_len - len(df)} invalid timestamp row(s) in {filename}.")
-                    else:
-                        continue # Skip files without a timestamp column
-                    
-                    # Add Metadata
-                    match = re.search(r'building_([A-Za-z]+)_', filename)
-                    building_id = match.group(1).upper() if match else 'UNKNOWN'
-                    df['building'] = f'Building {building_id}'
-                    
-                    all_dfs.append(df[['building', 'timestamp', 'kwh']].dropna(subset=['kwh']))
-
-                except Exception as e:
-                    print(f"  -- ERROR: Could not read {filename}. Reason: {e}")
+                if len(df) == 0:
                     continue
 
+                # Robust Timestamp Cleanup (invalid values were coerced to NaT while reading;
+                # short lines were skipped by the reader and are counted here too)
+                if 'timestamp' in df.columns:
+                    original_len = len(df) + short_lines
+                    df.dropna(subset=['timestamp'], inplace=True)
+                    if len(df) < original_len:
+                        print(f"  -- LOG: Dropped {original_len - len(df)} invalid timestamp row(s) in {filename}.")
+                else:
+                    continue # Skip files without a timestamp column
+                
+                # Add Metadata
+                building_id = building_id_from_filename(filename)
+                
+                all_dfs.append(df[['timestamp', 'kwh']].dropna(subset=['kwh']))
+                file_buildings.append(f'Building {building_id}')
+
+            except Exception as e:
+                print(f"  -- ERROR: Could not read {filename}. Reason: {e}")
+                continue
+
     except FileNotFoundError:
         print(f"FATAL ERROR: The data directory '{data_directory}' was not found.")
         return pd.DataFrame()
 
     if all_dfs:
-        df_combined = pd.concat(all_dfs, ignore_index=True)
-        # CRITICAL STEP: Set 'timestamp' as the index for resampling
-        df_combined = df_combined.set_index('timestamp').sort_index()
+        # 'building' is stored as categorical codes (one code per file), which the aggregation
+        # kernels below reuse as integer building labels
+        df_combined = combine_meter_frames(all_dfs, file_buildings)
+        # CRITICAL STEP: Set 'timestamp' as the index for the day/week bucketing
+        # (no sort needed: the bucket and summary kernels do not depend on row order)
+        df_combined = df_combined.set_index('timestamp')
         print("--- Master DataFrame Created and Indexed ---")
         return df_combined
     else:
@@ -70,40 +67,35 @@ def ingest_data_for_aggregation(data_directory='data'):
 def calculate_daily_totals(df):
     """
     Calculates the total daily electricity consumption (kWh) per building.
-    Uses resample('D') to achieve daily granularity.
+    Uses daily buckets (same result as resample('D')).
     """
     if df.empty:
         return pd.DataFrame()
     
     print("\n--- Calculating Daily Totals ---")
     
-    # 1. Group by building
-    # 2. Resample the time index by Day ('D')
-    # 3. Sum the 'kwh' values
-    df_daily = df.groupby('building')['kwh'].resample('D').sum().reset_index()
-    
-    # Filter out NaNs that may result from days with no data
-    df_daily.dropna(subset=['kwh'], inplace=True)
+    # 1. Bucket each reading by building (its categorical code from ingest) and Day
+    # 2. Sum the 'kwh' values per bucket (days with no data sum to 0, so there are no NaNs to drop)
+    df_daily = bucket_sum(df, days_per_bin=1)
     
     return df_daily
 
 def calculate_weekly_aggregates(df):
     """
     Calculates the total weekly electricity consumption (kWh) per building.
-    Uses resample('W') to achieve weekly granularity.
+    Uses week buckets ending on Sunday (same result as resample('W')).
     """
     if df.empty:
         return pd.DataFrame()
         
     print("\n--- Calculating Weekly Totals ---")
 
-    # 1. Group by building
-    # 2. Resample the time index by Week ('W')
-    # 3. Sum the 'kwh' values
-    df_weekly = df.groupby('building')['kwh'].resample('W').sum().reset_index()
+    # 1. Bucket each reading by building (its categorical code from ingest) and Week
+    #    (1970-01-01 is a Thursday, so shifting by 3 days makes each 7-day bucket end on a Sunday)
+    # 2. Sum the 'kwh' values per bucket (weeks with no data sum to 0, so there are no NaNs to drop)
+    df_weekly = bucket_sum(df, days_per_bin=7, offset_days=3)
     
     df_weekly.rename(columns={'timestamp': 'week_ending'}, inplace=True)
-    df_weekly.dropna(subset=['kwh'], inplace=True)
     
     return df_weekly
 
@@ -117,13 +109,17 @@ def building_wise_summary(df):
         
     print("\n--- Generating Building-Wise Summary ---")
     
-    # Use .groupby() to group by building and then .agg() to apply multiple statistical functions
-    summary_df = df.groupby('building')['kwh'].agg(
-        total_kwh='sum',
-        mean_kwh='mean',
-        min_kwh='min',
-        max_kwh='max'
-    ).reset_index()
+    # Map building names to integer labels (sorted, matching groupby order),
+    # then compute all statistics with the vectorized summarize kernel
+    labels, buildings = building_labels(df['building'])
+    totals, counts, mins, maxs = summarize(df['kwh'].to_numpy(dtype=float), labels, len(buildings))
+    summary_df = pd.DataFrame({
+        'building': buildings,
+        'total_kwh': totals,
+        'mean_kwh': totals / counts,
+        'min_kwh': mins,
+        'max_kwh': maxs
+    })
     
     # Convert the resulting DataFrame into a dictionary for storage/reporting
     # Use 'records' format for a list of dictionaries, easier to iterate
@@ -140,14 +136,17 @@ if __name__ == "__main__":
     if master_df.empty:
         print("\nCannot proceed with aggregation. Master DataFrame is empty.")
     else:
+        # The aggregation functions only read master_df (they return new frames),
+        # so it is passed directly instead of copying it for each step
+        
         # Step 2: Calculate Daily Totals
-        daily_df = calculate_daily_totals(master_df.copy())
+        daily_df = calculate_daily_totals(master_df)
         
         # Step 3: Calculate Weekly Totals
-        weekly_df = calculate_weekly_aggregates(master_df.copy())
+        weekly_df = calculate_weekly_aggregates(master_df)
         
         # Step 4: Calculate Building-Wise Summary
-        summary_results = building_wise_summary(master_df.copy())
+        summary_results = building_wise_summary(master_df)
 
         # --- FINAL OUTPUT ---
         
@@ -1,14 +1,35 @@
 import pandas as pd
+import numpy as np
 import os
-import re
 import matplotlib.pyplot as plt
+from energy_utils import (
+    read_meter_frames, print_ingest_log, combine_meter_frames, split_by_building, building_labels,
+    daily_pivot, weekly_totals, csv_mtimes, default_cache_dir, load_ingest_cache, save_ingest_cache, write_parquet_copies
+)
 
 # --- 1. MeterReading Class (No Change) ---
 class MeterReading:
     """Represents a single meter reading with a timestamp and kWh usage."""
+    __slots__ = ('timestamp', 'kwh')
+    _ts_cache = {}
+
     def __init__(self, timestamp, kwh):
-        self.timestamp = pd.to_datetime(timestamp)
-        self.kwh = float(kwh)
+        if isinstance(timestamp, pd.Timestamp):
+            ts = timestamp
+        else:
+            ts = MeterReading._ts_cache.get(timestamp)
+            if ts is None:
+                ts = pd.Timestamp(timestamp)
+                MeterReading._ts_cache[timestamp] = ts
+        self.timestamp = ts
+        self.kwh = kwh if type(kwh) is float else float(kwh)
+
+    @classmethod
+    def from_raw(cls, timestamp, kwh):
+        reading = object.__new__(cls)
+        reading.timestamp = timestamp
+        reading.kwh = kwh
+        return reading
     
     def __repr__(self):
         return f"MeterReading(timestamp='{self.timestamp.strftime('%Y-%m-%d')}', kwh={self.kwh})"
@@ -16,44 +37,101 @@ class MeterReading:
 # --- 2. Building Class (No Change) ---
 class Building:
     """Represents a building and manages its meter readings."""
+    __slots__ = ('name', '_ts', '_kwh', '_size', '_df', '_dirty', '_stats_cache')
+
     def __init__(self, name):
         self.name = name
-        self.meter_readings = []
-        self._df = pd.DataFrame() 
+        # Readings live column-wise in growable buffers; only the first _size slots are used
+        self._ts = np.empty(0, dtype='datetime64[ns]')
+        self._kwh = np.empty(0, dtype='f8')
+        self._size = 0
+        self._df = None # built on first use by _update_dataframe
+        self._dirty = True
+        self._stats_cache = None
+
+    @property
+    def meter_readings(self):
+        # Read-only snapshot built from the arrays (a tuple); add readings with add_reading
+        timestamps = pd.DatetimeIndex(self._ts[:self._size])
+        return tuple(MeterReading.from_raw(ts, kwh) for ts, kwh in zip(timestamps, self._kwh[:self._size].tolist()))
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= len(self._kwh):
+            return
+        capacity = max(2 * len(self._kwh), needed)
+        ts = np.empty(capacity, dtype='datetime64[ns]')
+        kwh = np.empty(capacity, dtype='f8')
+        ts[:self._size] = self._ts[:self._size]
+        kwh[:self._size] = self._kwh[:self._size]
+        self._ts, self._kwh = ts, kwh
 
     def add_reading(self, reading):
         if isinstance(reading, MeterReading):
-            self.meter_readings.append(reading)
+            self._reserve(1)
+            # Stored as local wall-clock time, like the arrays shared from combined_df
+            self._ts[self._size] = reading.timestamp.tz_localize(None).to_datetime64()
+            self._kwh[self._size] = reading.kwh
+            self._size += 1
+            self._dirty = True
+            self._stats_cache = None
         else:
             raise TypeError("Reading must be a MeterReading instance.")
+
+    def _attach(self, timestamps, kwh_values):
+        # Shares existing read-only arrays; capacity equals size, so the next add copies on grow
+        self._ts, self._kwh = timestamps, kwh_values
+        self._size = len(kwh_values)
+        self._dirty = True
+        self._stats_cache = None
     
     def _update_dataframe(self):
-        data = [{'timestamp': r.timestamp, 'kwh': r.kwh} for r in self.meter_readings]
-        if data:
-            self._df = pd.DataFrame(data).set_index('timestamp').sort_index()
+        if not self._dirty:
+            return
+        if self._size:
+            self._df = pd.DataFrame(
+                {'kwh': self._kwh[:self._size]},
+                index=pd.DatetimeIndex(self._ts[:self._size], name='timestamp')
+            ).sort_index(kind='stable')
+        self._dirty = False
             
+    def _stats(self):
+        # (total, mean, min, max) kWh, computed once and reused until readings change
+        if self._stats_cache is None:
+            kwh = self._kwh[:self._size]
+            # Skip NaN readings (like pandas); the array is only copied if there are any
+            valid = ~np.isnan(kwh)
+            if not valid.all():
+                kwh = kwh[valid]
+            if len(kwh):
+                total = float(kwh.sum())
+                self._stats_cache = (total, total / len(kwh), kwh.min(), kwh.max())
+            else:
+                self._stats_cache = (0.0, np.nan, np.nan, np.nan)
+        return self._stats_cache
+
     def calculate_total_consumption(self):
-        self._update_dataframe()
-        if self._df.empty:
-            return 0.0
-        return round(self._df['kwh'].sum(), 2)
+        return round(self._stats()[0], 2)
 
     def generate_report(self):
-        self._update_dataframe()
         total_kwh = self.calculate_total_consumption()
-        summary = self._df['kwh'].agg(mean_kwh='mean', min_kwh='min', max_kwh='max')
+        _, mean_kwh, min_kwh, max_kwh = self._stats()
+        summary = {'mean_kwh': mean_kwh, 'min_kwh': min_kwh, 'max_kwh': max_kwh}
         # ... (rest of report generation) ...
         report = (
             f"\n--- Report for Building: {self.name} ---\n"
-            f"Total Months of Data: {len(self.meter_readings)}\n"
+            f"Total Months of Data: {self._size}\n"
             f"Total Consumption (kWh): {total_kwh}\n"
             f"Mean Consumption (kWh): {summary['mean_kwh']:.2f}\n"
             f"Min Consumption (kWh): {summary['min_kwh']:.2f}\n"
             f"Max Consumption (kWh): {summary['max_kwh']:.2f}\n"
             "Monthly Readings:\n"
         )
-        for reading in sorted(self.meter_readings, key=lambda r: r.timestamp):
-            report += f"  - {reading.timestamp.strftime('%Y-%m')}: {reading.kwh} kWh\n"
+        # Format the (time-sorted) readings from _df: strftime runs once over the whole index
+        if self._size:
+            self._update_dataframe()
+            months = self._df.index.strftime('%Y-%m')
+            report += ''.join(f"  - {month}: {kwh} kWh\n" for month, kwh in zip(months, self._df['kwh'].tolist()))
         return report
 
 # --- 3. BuildingManager Class (Updated with Visualization) ---
@@ -62,50 +140,77 @@ class BuildingManager:
     def __init__(self):
         self.buildings = {}
         self.combined_df = pd.DataFrame()
+        self._daily_cache = None
+        self.cache_dir = None # Parquet cache of combined_df, kept in <data_directory>/cache unless set
+
+    def _load_cache(self, cache_dir, cache_key):
+        """
+        Restores combined_df and the Building objects from the Parquet cache if it is still
+        valid, and returns the ingest log stored with it (None if the cache can't be used).
+        """
+        cached = load_ingest_cache(cache_dir, cache_key)
+        if cached is None:
+            return None
+        self.combined_df, ingest_log = cached
+        self._share_with_buildings()
+        return ingest_log
+
+    def _share_with_buildings(self):
+        """
+        Points every Building at its block of combined_df's arrays (see split_by_building).
+        Every building category gets a Building, even one without rows, so a cached run
+        has the same buildings as a cold ingest.
+        """
+        self.combined_df, blocks = split_by_building(self.combined_df)
+        for building_name, timestamps, kwh_values in blocks:
+            building_id = building_name.replace('Building ', '', 1)
+            if building_id not in self.buildings:
+                self.buildings[building_id] = Building(building_name)
+            self.buildings[building_id]._attach(timestamps, kwh_values)
+
+    def convert_csvs_to_parquet(self, data_directory='data'):
+        """
+        One-time conversion: writes a zstd-compressed Parquet copy (with parsed timestamps)
+        next to every CSV in data_directory. ingest_data reads these copies instead of the CSVs.
+        """
+        write_parquet_copies(data_directory)
 
     def ingest_data(self, data_directory='data'):
         # ... (Ingestion logic from previous step, ensuring self.combined_df is set_index('timestamp'))
-        all_dfs = []
-        for filename in os.listdir(data_directory):
-            if filename.endswith('.csv'):
-                file_path = os.path.join(data_directory, filename)
-                try:
-                    df = pd.read_csv(file_path, dtype={'kwh': float}, on_bad_lines='skip')
-                    if 'timestamp' in df.columns:
-                        original_len = len(df)
-                        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                        df.dropna(subset=['timestamp', 'kwh'], inplace=True)
-                        # LOGGING (omitted for brevity, assume success)
-                    else: continue
-                    match = re.search(r'building_([A-Za-z]+)_', filename)
-                    building_id = match.group(1).upper() if match else 'UNKNOWN'
-                    building_name = f'Building {building_id}'
-                    df['building'] = building_name
-                    all_dfs.append(df[['building', 'timestamp', 'kwh']])
-                    
-                    if building_id not in self.buildings:
-                        self.buildings[building_id] = Building(building_name)
-                    building = self.buildings[building_id]
-                    for index, row in df.iterrows():
-                        reading = MeterReading(row['timestamp'], row['kwh'])
-                        building.add_reading(reading)
-                except Exception as e:
-                    print(f"  -- ERROR: Could not process {filename}. Reason: {e}")
-                    continue
-
-        if all_dfs:
-            self.combined_df = pd.concat(all_dfs, ignore_index=True)
-            self.combined_df = self.combined_df.set_index('timestamp').sort_index()
+        cache_dir = self.cache_dir or default_cache_dir(data_directory)
+        cache_key = {'data_directory': os.path.abspath(data_directory), 'files': csv_mtimes(data_directory)}
+        ingest_log = self._load_cache(cache_dir, cache_key)
+        if ingest_log is not None:
+            print_ingest_log(ingest_log, cache_dir)
+            self._daily_cache = None
+            return
+
+        frames, file_buildings, ingest_log = read_meter_frames(data_directory)
+        print_ingest_log(ingest_log)
+
+        # The Building objects are created from combined_df's building categories below
+        if frames:
+            self.combined_df = combine_meter_frames(frames, file_buildings).set_index('timestamp')
+            self._share_with_buildings()
+            save_ingest_cache(cache_dir, cache_key, self.combined_df, ingest_log)
+        self._daily_cache = None
+
+    def _compute_daily(self):
+        """
+        Builds the daily (day x building) totals matrix and each building's first and last
+        reading day (see daily_pivot) from combined_df once and memoizes them.
+        """
+        if self._daily_cache is None:
+            self._daily_cache = daily_pivot(self.combined_df)
+        return self._daily_cache
 
     def get_daily_aggregates(self):
         """Calculates daily consumption and pivots it for plotting."""
         if self.combined_df.empty: return pd.DataFrame()
         
-        # Calculate daily totals (Task 2 logic)
-        df_daily = self.combined_df.groupby('building')['kwh'].resample('D').sum()
-        
-        # Pivot for easy plotting (columns = buildings, index = timestamp)
-        df_pivot = df_daily.unstack(level=0, fill_value=0)
+        # Daily totals (Task 2 logic), summed straight into pivoted form
+        # (columns = buildings, index = timestamp) for easy plotting
+        df_pivot, _, _ = self._compute_daily()
         
         return df_pivot
     
@@ -113,11 +218,12 @@ class BuildingManager:
         """Calculates the average weekly consumption for the bar chart."""
         if self.combined_df.empty: return pd.DataFrame()
         
-        # Calculate total usage per week, then average the weekly totals per building
-        df_weekly_total = self.combined_df.groupby('building')['kwh'].resample('W').sum()
+        # Calculate total usage per week (7-day buckets ending on Sunday, like resample('W'))
+        # from the (much smaller) memoized daily totals
+        df_weekly_total = weekly_totals(*self._compute_daily())
         
         # Group by building and calculate the mean of the weekly totals
-        df_weekly_avg = df_weekly_total.groupby('building').mean().reset_index()
+        df_weekly_avg = df_weekly_total.groupby('building', sort=False)['kwh'].mean().reset_index()
         
         return df_weekly_avg
     
@@ -163,16 +269,23 @@ class BuildingManager:
         # --- SUBPLOT 3: Scatter Plot (Peak-Hour Consumption vs. Time/Building) ---
         # NOTE: Since the data is monthly *total*, not hourly, we'll plot the monthly total as the 'peak' event.
         ax3 = axes[2]
-        df_combined_clean = self.combined_df.reset_index()
-        
-        # Scatter plot for each building's monthly consumption over time
-        for name, group in df_combined_clean.groupby('building'):
-            ax3.scatter(group['timestamp'], group['kwh'], label=name, alpha=0.7)
-            
+
+        # Scatter plot of every building's monthly consumption over time in one draw call,
+        # colored by building code (codes wrap every 10 and vmin/vmax pin code k to tab10 color k,
+        # like the default color cycle, so buildings past the tenth reuse colors instead of clamping)
+        codes, buildings = building_labels(self.combined_df['building'])
+        color_codes = codes % 10
+        scatter = ax3.scatter(
+            self.combined_df.index.values, self.combined_df['kwh'].to_numpy(),
+            c=color_codes, cmap='tab10', vmin=0, vmax=9, alpha=0.7
+        )
+
         ax3.set_title('3. Monthly Peak Consumption Events')
         ax3.set_xlabel('Date (Time)')
         ax3.set_ylabel('Monthly kWh Total ("Peak Event")')
-        ax3.legend(title='Building')
+        # One legend entry per building, in category order, using that building's wrapped color code
+        legend_handles, _ = scatter.legend_elements(num=list(np.arange(len(buildings)) % 10))
+        ax3.legend(handles=legend_handles, labels=list(buildings), title='Building')
         ax3.grid(True, linestyle='--', alpha=0.6)
 
         # Final layout adjustments and saving
@@ -1,6 +1,5 @@
 import pandas as pd
-import os
-import re # Used for robust filename parsing
+from energy_utils import MONTH_NAMES, read_meter_csvs, building_id_from_filename, combine_meter_frames
 
 def ingest_and_validate_data(data_directory='data'):
     """
@@ -8,73 +7,67 @@ def ingest_and_validate_data(data_directory='data'):
     validates the data, adds metadata, and combines them into one DataFrame.
     """
     all_dfs = []
+    file_buildings = [] # building name of each frame in all_dfs
     
     print(f"--- Starting Data Ingestion from /{data_directory}/ ---")
     
-    # Use os.walk or os.listdir to loop through the directory
+    # Use os.scandir to loop through the directory
     try:
-        # Get a list of all items in the 'data' directory
-        for filename in os.listdir(data_directory):
-            # Check if the file is a CSV file
-            if filename.endswith('.csv'):
-                file_path = os.path.join(data_directory, filename)
-                print(f"\nProcessing file: {filename}")
+        # Read every CSV file in the 'data' directory concurrently (results come back in directory order)
+        for filename, pending_read in read_meter_csvs(data_directory).items():
+            print(f"\nProcessing file: {filename}")
+            
+            # 1. Handle File Reading Exceptions
+            try:
+                # Use pyarrow's CSV reader (via energy_utils.read_meter_csv) to read the file
+                # Handle corrupt data by skipping bad lines
+                # Note: We rely on manual timestamp conversion below
+                df, short_lines = pending_read.result()
                 
-                # 1. Handle File Reading Exceptions
-                try:
-                    # Use pandas.read_csv to read the file
-                    # Handle corrupt data by skipping bad lines
-                    df = pd.read_csv(
-                        file_path,
-                        dtype={'kwh': float},
-                        # Note: We rely on manual conversion below, so remove parse_dates here
-                        on_bad_lines='skip' 
-                    )
-                    
-                    if len(df) == 0:
-                        print("  -- WARNING: File skipped due to reading errors or being empty.")
-                        continue
-                        
-                except Exception as e:
-                    print(f"  -- ERROR: Could not read file {filename} completely. Skipping. Reason: {e}")
+                if len(df) == 0:
+                    print("  -- WARNING: File skipped due to reading errors or being empty.")
                     continue
                     
+            except Exception as e:
+                print(f"  -- ERROR: Could not read file {filename} completely. Skipping. Reason: {e}")
+                continue
                 
-                # 2. Data Type Validation and Conversion (Robustness Fix)
-                if 'timestamp' in df.columns:
-                    # Attempt to force the column to datetime type, coercing errors to NaT (Not a Time)
-                    original_len = len(df)
-                    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                    
-                    # Drop rows where the timestamp conversion failed (i.e., NaT)
-                    df.dropna(subset=['timestamp'], inplace=True)
-                    
-                    # Log the number of invalid rows dropped
-                    if len(df) < original_len:
-                        print(f"  -- VALIDATION: Dropped {original_len - len(df)} row(s) with invalid timestamp data.")
-                else:
-                    print("  -- WARNING: 'timestamp' column is missing from file. Skipping.")
-                    continue
+            
+            # 2. Data Type Validation (Robustness Fix)
+            if 'timestamp' in df.columns:
+                # read_meter_csv already forced the column to datetime type while streaming,
+                # coercing errors to NaT (Not a Time); short lines were skipped while reading
+                original_len = len(df) + short_lines
                 
+                # Drop rows where the timestamp conversion failed (i.e., NaT)
+                df.dropna(subset=['timestamp'], inplace=True)
                 
-                # 3. Add Metadata (Building Name and Month)
-                # Extract building name (e.g., 'A' from 'building_A_sep.csv')
-                match = re.search(r'building_([A-Za-z]+)_', filename)
-                building_id = match.group(1).upper() if match else 'UNKNOWN'
-                df['building'] = f'Building {building_id}'
-                
-                # Extract month (now safe because 'timestamp' is confirmed datetime)
-                df['month'] = df['timestamp'].dt.strftime('%B')
+                # Log the number of invalid rows dropped
+                if len(df) < original_len:
+                    print(f"  -- VALIDATION: Dropped {original_len - len(df)} row(s) with invalid timestamp data.")
+            else:
+                print("  -- WARNING: 'timestamp' column is missing from file. Skipping.")
+                continue
+            
+            
+            # 3. Add Metadata (Building Name and Month)
+            # Extract building name (e.g., 'A' from 'building_A_sep.csv')
+            building_id = building_id_from_filename(filename)
+            
+            # Extract month (now safe because 'timestamp' is confirmed datetime)
+            # Integer month codes + a shared name table avoid a per-row strftime call
+            df['month'] = pd.Categorical.from_codes(df['timestamp'].dt.month.to_numpy() - 1, categories=MONTH_NAMES)
 
-                # Basic Validation: Check for required columns after loading (redundant check, but safe)
-                if 'kwh' not in df.columns:
-                    print("  -- WARNING: 'kwh' column is missing after processing. Skipping.")
-                    continue
-                
-                # Final check and cleanup
-                df_clean = df[['building', 'month', 'timestamp', 'kwh']].dropna(subset=['kwh'])
-                all_dfs.append(df_clean)
-                print(f"  -- SUCCESS: {len(df_clean)} records ingested and added to master list.")
+            # Basic Validation: Check for required columns after loading (redundant check, but safe)
+            if 'kwh' not in df.columns:
+                print("  -- WARNING: 'kwh' column is missing after processing. Skipping.")
+                continue
+            
+            # Final check and cleanup
+            df_clean = df[['month', 'timestamp', 'kwh']].dropna(subset=['kwh'])
+            all_dfs.append(df_clean)
+            file_buildings.append(f'Building {building_id}')
+            print(f"  -- SUCCESS: {len(df_clean)} records ingested and added to master list.")
 
     except FileNotFoundError:
         print(f"\nFATAL ERROR: The data directory '{data_directory}' was not found.")
@@ -88,7 +81,8 @@ def ingest_and_validate_data(data_directory='data'):
 
     # 4. Combine all DataFrames into one clean DataFrame
     if all_dfs:
-        df_combined = pd.concat(all_dfs, ignore_index=True)
+        # 'building' holds a few repeated names: it is stored as categorical codes to save memory
+        df_combined = combine_meter_frames(all_dfs, file_buildings)
         # Sort for clean presentation
         df_combined = df_combined.sort_values(by=['building', 'timestamp']).reset_index(drop=True)
         return df_combined
@@ -0,0 +1,434 @@
+"""
+Shared helpers for the campus energy scripts: meter file readers, the vectorized
+aggregation kernels and the Parquet ingest cache.
+"""
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+import calendar
+import os
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pandas.tseries.api import guess_datetime_format
+
+# Month names indexed by month number - 1 (January is code 0)
+MONTH_NAMES = list(calendar.month_name)[1:]
+
+# Building ID in meter filenames (e.g. 'A' in 'building_A_sep.csv'), compiled once
+BUILDING_ID_RE = re.compile(r'building_([A-Za-z]+)_')
+
+def building_id_from_filename(filename):
+    """Extracts the building ID (e.g. 'A' from 'building_A_sep.csv'), or 'UNKNOWN'."""
+    match = BUILDING_ID_RE.search(filename)
+    return match.group(1).upper() if match else 'UNKNOWN'
+
+# --- Reading meter files ---
+
+def detect_timestamp_format(timestamps):
+    """
+    Picks the to_datetime format for a file's timestamp strings from its first value whose
+    format can be guessed: 'ISO8601' (pandas' fast ISO parser, which also accepts date-only
+    and 'T'-separated values) for ISO dates, else the guessed format (e.g. '%m/%d/%Y').
+    Returns 'mixed' (parse each value on its own) if no value has a recognizable format,
+    and None if there are no values yet.
+    """
+    values = timestamps.dropna()
+    for value in values:
+        guessed = guess_datetime_format(value)
+        if guessed is not None:
+            return 'ISO8601' if guessed.startswith('%Y-%m-%d') else guessed
+    return 'mixed' if len(values) else None
+
+def read_meter_csv(file_path, block_size=16 * 1024 * 1024):
+    """
+    Streams a meter CSV through pyarrow's CSV reader, `block_size` bytes at a time.
+    Timestamps are parsed block by block (invalid values become NaT), so the raw text
+    of a large file is never held in memory all at once. Malformed lines are skipped
+    (like on_bad_lines='skip'); returns the DataFrame and the number of skipped short lines.
+    """
+    short_lines = 0
+
+    def skip_line(row):
+        nonlocal short_lines
+        # read_csv(on_bad_lines='skip') dropped lines with too many fields silently, but kept
+        # short lines padded with NaN, which ingest then dropped and logged as bad rows
+        if row.actual_columns < row.expected_columns:
+            short_lines += 1
+        return 'skip'
+
+    # 'timestamp' is read as a string column so invalid values can be coerced to NaT per block
+    reader = pv.open_csv(
+        file_path,
+        read_options=pv.ReadOptions(block_size=block_size),
+        parse_options=pv.ParseOptions(invalid_row_handler=skip_line),
+        convert_options=pv.ConvertOptions(column_types={'timestamp': pa.string(), 'kwh': pa.float64()})
+    )
+    # Keep the timestamp text Arrow-backed in pandas (no Python str object per value) until it is parsed
+    string_types = {pa.string(): pd.StringDtype('pyarrow')}.get
+    # Detected once per file (like pandas' own inference from the first value), then used for every block
+    timestamp_format = None
+
+    def to_frame(batch):
+        nonlocal timestamp_format
+        chunk = batch.to_pandas(types_mapper=string_types)
+        if 'timestamp' in chunk.columns:
+            if timestamp_format is None:
+                timestamp_format = detect_timestamp_format(chunk['timestamp'])
+            chunk['timestamp'] = pd.to_datetime(chunk['timestamp'], format=timestamp_format, errors='coerce', cache=True)
+        return chunk
+
+    chunks = [to_frame(batch) for batch in reader]
+    if not chunks:
+        # Header-only file: convert an empty table the same way, so the columns keep their types
+        # (an empty timestamp column would otherwise be inferred as datetime64[s])
+        empty = to_frame(reader.schema.empty_table())
+        if 'timestamp' in empty.columns:
+            empty['timestamp'] = empty['timestamp'].astype('datetime64[ns]')
+        return empty, short_lines
+    return pd.concat(chunks, ignore_index=True), short_lines
+
+def read_meter_parquet(file_path):
+    """
+    Reads a meter file written by write_parquet_copies. Timestamps are stored already
+    parsed, so no text is tokenized; returns the same (DataFrame, short_lines) pair
+    as read_meter_csv (the count is kept in the file's metadata).
+    """
+    table = pq.read_table(file_path)
+    short_lines = int((table.schema.metadata or {}).get(b'short_lines', 0))
+    return table.to_pandas(), short_lines
+
+def read_meter_file(data_directory, filename):
+    """Reads one meter CSV, preferring its Parquet copy unless the CSV was modified after converting."""
+    csv_path = os.path.join(data_directory, filename)
+    parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        return read_meter_parquet(parquet_path)
+    return read_meter_csv(csv_path)
+
+def read_meter_csvs(data_directory):
+    """
+    Starts reading every CSV file in data_directory on a thread pool (pyarrow's
+    reader releases the GIL). Returns {filename: Future} in directory order; each
+    Future resolves to the (DataFrame, short_lines) pair from read_meter_file.
+    """
+    # scandir's entries carry the file type from the directory listing (no extra stat per file)
+    with os.scandir(data_directory) as entries:
+        csv_files = [entry.name for entry in entries if entry.is_file() and entry.name.endswith('.csv')]
+    executor = ThreadPoolExecutor()
+    pending_reads = {
+        filename: executor.submit(read_meter_file, data_directory, filename)
+        for filename in csv_files
+    }
+    executor.shutdown(wait=False)
+    return pending_reads
+
+def read_meter_frames(data_directory):
+    """
+    Reads every meter CSV in data_directory and drops rows without a valid timestamp or kWh.
+    Returns (frames, file_buildings, ingest_log): the cleaned ['timestamp', 'kwh'] frame and
+    building name of each ingested file, and {filename: {'dropped_rows': n} or {'error': reason}}
+    for the files that lost rows or could not be processed, in directory order.
+    """
+    frames = []
+    file_buildings = [] # building name of each frame in frames
+    ingest_log = {}
+    for filename, pending_read in read_meter_csvs(data_directory).items():
+        try:
+            df, short_lines = pending_read.result()
+            if 'timestamp' not in df.columns:
+                continue
+            original_len = len(df) + short_lines
+            # Boolean mask on the raw arrays; the frame is only copied when a row is actually dropped
+            mask = df['timestamp'].notna().to_numpy() & df['kwh'].notna().to_numpy()
+            if not mask.all():
+                df = df[mask]
+            if len(df) < original_len:
+                ingest_log[filename] = {'dropped_rows': original_len - len(df)}
+            frames.append(df[['timestamp', 'kwh']])
+            file_buildings.append(f'Building {building_id_from_filename(filename)}')
+        except Exception as e:
+            ingest_log[filename] = {'error': str(e)}
+    return frames, file_buildings, ingest_log
+
+def print_ingest_log(ingest_log, cache_dir=None):
+    """
+    Prints the dropped-row and error messages of a read_meter_frames ingest_log. On a cache
+    hit, pass the cache_dir: the data's source is printed first, then the log stored with it.
+    """
+    if cache_dir is not None:
+        print(f"  -- LOG: CSV files unchanged; loaded ingested data from {cache_dir}/.")
+    for filename, entry in ingest_log.items():
+        if 'error' in entry:
+            print(f"  -- ERROR: Could not process {filename}. Reason: {entry['error']}")
+        else:
+            print(f"  -- LOG: Dropped {entry['dropped_rows']} bad row(s) in {filename}.")
+
+def combine_meter_frames(frames, file_buildings):
+    """
+    Concatenates the per-file frames and inserts 'building' as the first column. It holds
+    a few repeated names, so it is stored as categorical codes built from one code per file
+    (file_buildings[i] names frames[i]) instead of hashing a name string on every row.
+    """
+    df_combined = pd.concat(frames, ignore_index=True)
+    names = sorted(set(file_buildings))
+    codes = np.repeat([names.index(name) for name in file_buildings], [len(df) for df in frames])
+    df_combined.insert(0, 'building', pd.Categorical.from_codes(codes, categories=names))
+    return df_combined
+
+def split_by_building(combined_df):
+    """
+    Orders combined_df building-major and returns (combined_df, blocks), where blocks lists
+    (building name, timestamps, kwh values) with views of each building's contiguous block
+    of combined_df's arrays, for every category of the building column (a building whose
+    file had no valid rows gets empty arrays). Rows keep their file order within a building:
+    nothing downstream needs combined_df in time order, so no timestamp sort is done.
+    """
+    names = combined_df['building'].cat.categories
+    codes = combined_df['building'].cat.codes.to_numpy()
+    if (np.diff(codes) < 0).any():
+        # Stable sort on the small integer codes (a linear-time radix sort in NumPy)
+        order = np.argsort(codes, kind='stable')
+        combined_df = combined_df.take(order)
+        codes = codes[order]
+    timestamps = wall_clock(combined_df.index)
+    kwh_values = combined_df['kwh'].to_numpy()
+    ends = np.cumsum(np.bincount(codes, minlength=len(names)))
+    starts = np.concatenate(([0], ends[:-1]))
+    blocks = [
+        (building_name, timestamps[start:end], kwh_values[start:end])
+        for building_name, start, end in zip(names, starts, ends)
+    ]
+    return combined_df, blocks
+
+# --- Aggregation kernels ---
+
+def wall_clock(index):
+    """
+    Returns a DatetimeIndex's values as naive datetime64 in local wall-clock time. For a
+    tz-aware index, .values would be in UTC, which puts late-evening readings on the next day.
+    """
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.values
+
+def day_labels(days, index):
+    """Midnight timestamps for day numbers (days since the Unix epoch), in the unit and time zone of `index`."""
+    labels = pd.DatetimeIndex(days.astype('datetime64[D]')).as_unit(index.unit)
+    return labels.tz_localize(index.tz)
+
+def building_labels(buildings):
+    """
+    Returns (integer labels, names) for a building column, in sorted-groupby order.
+    A categorical column (as built at ingest) reuses its precomputed codes instead of
+    re-hashing every string; unobserved categories are dropped. Other columns are factorized.
+    """
+    if not isinstance(buildings.dtype, pd.CategoricalDtype):
+        return pd.factorize(buildings, sort=True)
+    labels = buildings.cat.codes.to_numpy()
+    names = buildings.cat.categories
+    observed = np.bincount(labels, minlength=len(names)) > 0
+    if not observed.all():
+        labels = (np.cumsum(observed) - 1)[labels]
+        names = names[observed]
+    return labels, names
+
+def bucket_sum(df, days_per_bin, offset_days=0):
+    """
+    Sums 'kwh' per building into fixed-width day buckets in a single vectorized pass.
+    Equivalent to groupby('building')['kwh'].resample(...).sum(): every bucket between
+    a building's first and last reading is returned (empty buckets sum to 0), and each
+    bucket is labelled with its last day. `offset_days` shifts the bucket edges
+    (3 aligns 7-day buckets to end on Sunday, like resample('W')).
+    """
+    labels, buildings = building_labels(df['building'])
+    kwh = df['kwh'].to_numpy(dtype=float)
+    kwh = np.where(np.isnan(kwh), 0.0, kwh)
+
+    # Integer bucket index per reading (local days since the Unix epoch, floored to the bucket width)
+    days = wall_clock(df.index).astype('datetime64[D]').view('i8')
+    bins = (days + offset_days) // days_per_bin
+
+    # First and last bucket of each building define its contiguous output range
+    n_groups = len(buildings)
+    first_bin = np.full(n_groups, np.iinfo(np.int64).max)
+    last_bin = np.full(n_groups, np.iinfo(np.int64).min)
+    np.minimum.at(first_bin, labels, bins)
+    np.maximum.at(last_bin, labels, bins)
+    sizes = last_bin - first_bin + 1
+    starts = np.cumsum(sizes) - sizes
+
+    # Scatter-add every reading straight into its (building, bucket) output slot
+    slots = starts[labels] + bins - first_bin[labels]
+    totals = np.bincount(slots, weights=kwh, minlength=sizes.sum())
+
+    out_bins = np.arange(sizes.sum()) - np.repeat(starts, sizes) + np.repeat(first_bin, sizes)
+    label_days = out_bins * days_per_bin + (days_per_bin - 1 - offset_days)
+    return pd.DataFrame({
+        'building': np.repeat(buildings, sizes),
+        'timestamp': day_labels(label_days, df.index),
+        'kwh': totals
+    })
+
+def daily_pivot(df):
+    """
+    Sums 'kwh' into a dense (day x building) matrix with one bincount over flat
+    (day, building) cell indices. Returns (pivot, first_day, last_day): the matrix as a
+    DataFrame (index = timestamp, columns = buildings), the same result as unstacking the
+    daily bucket sums with fill_value=0 (only days inside at least one building's
+    first-to-last range are kept), and each building's first and last reading day
+    (days since the Unix epoch), which the zero-filled matrix alone doesn't tell apart.
+    """
+    labels, buildings = building_labels(df['building'])
+    kwh = df['kwh'].to_numpy(dtype=float)
+    kwh = np.where(np.isnan(kwh), 0.0, kwh)
+    days = wall_clock(df.index).astype('datetime64[D]').view('i8')
+
+    day_min = days.min()
+    n_days = days.max() - day_min + 1
+    n_buildings = len(buildings)
+    cells = (days - day_min) * n_buildings + labels
+    totals = np.bincount(cells, weights=kwh, minlength=n_days * n_buildings).reshape(n_days, n_buildings)
+
+    # Mark the days covered by some building's range (+1 at its first day, -1 after its last)
+    first_day = np.full(n_buildings, np.iinfo(np.int64).max)
+    last_day = np.full(n_buildings, np.iinfo(np.int64).min)
+    np.minimum.at(first_day, labels, days)
+    np.maximum.at(last_day, labels, days)
+    coverage = np.zeros(n_days + 1, dtype=np.int64)
+    np.add.at(coverage, first_day - day_min, 1)
+    np.add.at(coverage, last_day - day_min + 1, -1)
+    keep = np.cumsum(coverage[:-1]) > 0
+
+    timestamps = day_labels(day_min + np.flatnonzero(keep), df.index)
+    pivot = pd.DataFrame(
+        totals[keep],
+        index=timestamps.rename('timestamp'),
+        columns=pd.Index(buildings, name='building')
+    )
+    return pivot, first_day, last_day
+
+def weekly_totals(pivot, first_day, last_day, offset_days=3):
+    """
+    Sums a daily_pivot result into 7-day buckets without going back to the readings.
+    Returns the same long-form frame as bucket_sum(df, 7, offset_days): each building
+    gets every bucket between its first and last reading day, labelled with its last day
+    (offset_days=3 ends the buckets on Sunday, like resample('W')).
+    """
+    buildings = pivot.columns
+    weeks = (wall_clock(pivot.index).astype('datetime64[D]').view('i8') + offset_days) // 7
+    # The pivot's days are sorted, so each week's rows are contiguous: one reduceat sums them
+    week_min = weeks[0]
+    starts = np.flatnonzero(np.diff(weeks, prepend=week_min - 1))
+    week_sums = np.zeros((weeks[-1] - week_min + 1, len(buildings)))
+    week_sums[weeks[starts] - week_min] = np.add.reduceat(pivot.to_numpy(), starts, axis=0)
+
+    # Every building's contiguous range of weeks, read out of its column of week_sums
+    first_week = (first_day + offset_days) // 7
+    last_week = (last_day + offset_days) // 7
+    sizes = last_week - first_week + 1
+    columns = np.repeat(np.arange(len(buildings)), sizes)
+    out_weeks = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes) + np.repeat(first_week, sizes)
+    label_days = out_weeks * 7 + (6 - offset_days)
+    return pd.DataFrame({
+        'building': np.repeat(buildings, sizes),
+        'timestamp': day_labels(label_days, pivot.index),
+        'kwh': week_sums[out_weeks - week_min, columns]
+    })
+
+def summarize(values, labels, n_groups):
+    """
+    Computes per-group sum, count, min and max of `values` using integer group
+    `labels` (0..n_groups-1). Each statistic is a single vectorized scan, so no
+    per-group Python dispatch is needed. NaN values are skipped, like pandas.
+    """
+    valid = ~np.isnan(values)
+    # Ingest already drops missing kWh, so the compacting copies are usually skipped
+    if not valid.all():
+        values, labels = values[valid], labels[valid]
+    out_sum = np.bincount(labels, weights=values, minlength=n_groups)
+    out_count = np.bincount(labels, minlength=n_groups)
+    out_min = np.full(n_groups, np.inf)
+    out_max = np.full(n_groups, -np.inf)
+    np.minimum.at(out_min, labels, values)
+    np.maximum.at(out_max, labels, values)
+    return out_sum, out_count, out_min, out_max
+
+# --- Ingestion cache and Parquet copies ---
+
+# Stored in the cache metadata; bump it when the layout of the cached frame changes
+INGEST_CACHE_VERSION = 3
+
+def csv_mtimes(data_directory):
+    """Returns {filename: mtime} for the CSV files in data_directory (the cache key)."""
+    with os.scandir(data_directory) as entries:
+        return {
+            entry.name: entry.stat().st_mtime
+            for entry in sorted(entries, key=lambda entry: entry.name)
+            if entry.is_file() and entry.name.endswith('.csv')
+        }
+
+def default_cache_dir(data_directory):
+    """The ingest cache lives next to the data it was built from, not in the working directory."""
+    return os.path.join(data_directory, 'cache')
+
+def load_ingest_cache(cache_dir, cache_key):
+    """
+    Returns (combined DataFrame, ingest_log) from the Parquet cache, or None if the cache is
+    missing, stale or not in the expected layout. The frame is ordered building-major (see
+    split_by_building); ingest_log is the read_meter_frames log of the ingest that built it.
+    """
+    try:
+        with open(os.path.join(cache_dir, 'combined_meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != INGEST_CACHE_VERSION or meta.get('key') != cache_key:
+            return None
+        combined_df = pd.read_parquet(os.path.join(cache_dir, 'combined.parquet'), engine='pyarrow')
+        # Check the layout here, so a foreign or outdated file falls back to a normal ingest
+        if not isinstance(combined_df.index, pd.DatetimeIndex):
+            return None
+        combined_df, _ = split_by_building(combined_df)
+        return combined_df, meta['ingest_log']
+    except (OSError, ValueError, KeyError, AttributeError, TypeError):
+        return None
+
+def save_ingest_cache(cache_dir, cache_key, combined_df, ingest_log):
+    """
+    Writes combined_df to the Parquet cache, followed by the metadata that validates it
+    (and the ingest_log, so a cache hit can report the same dropped rows and errors).
+    Caching is best-effort: if the cache can't be written (e.g. a read-only directory),
+    a warning is printed and the caller keeps the data it already ingested.
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        combined_df.to_parquet(
+            os.path.join(cache_dir, 'combined.parquet'), engine='pyarrow', compression='snappy'
+        )
+        meta = {'version': INGEST_CACHE_VERSION, 'key': cache_key, 'ingest_log': ingest_log}
+        with open(os.path.join(cache_dir, 'combined_meta.json'), 'w') as f:
+            json.dump(meta, f)
+    except OSError as e:
+        print(f"  -- WARNING: Could not write the ingest cache to {cache_dir}/. Reason: {e}")
+
+def write_parquet_copies(data_directory='data'):
+    """
+    One-time conversion: writes a zstd-compressed Parquet copy (with parsed timestamps)
+    next to every CSV in data_directory. read_meter_file reads these copies instead of the CSVs.
+    """
+    with os.scandir(data_directory) as entries:
+        csv_entries = [entry for entry in entries if entry.is_file() and entry.name.endswith('.csv')]
+    for entry in csv_entries:
+        filename, csv_path = entry.name, entry.path
+        try:
+            df, short_lines = read_meter_csv(csv_path)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # Keep the short-line count so ingest logs the same dropped rows
+            metadata = {**(table.schema.metadata or {}), b'short_lines': str(short_lines).encode()}
+            pq.write_table(
+                table.replace_schema_metadata(metadata),
+                os.path.splitext(csv_path)[0] + '.parquet', compression='zstd'
+            )
+        except Exception as e:
+            print(f"  -- ERROR: Could not convert {filename}. Reason: {e}")
@@ -1,39 +1,102 @@
 import pandas as pd
+import numpy as np
 import os
-import re
 import matplotlib.pyplot as plt
+from energy_utils import (
+    MONTH_NAMES, read_meter_frames, print_ingest_log, combine_meter_frames, split_by_building, building_labels,
+    bucket_sum, summarize, csv_mtimes, default_cache_dir, load_ingest_cache, save_ingest_cache, write_parquet_copies
+)
 
 # --- OOP Classes (MeterReading and Building are unchanged from Task 3) ---
 class MeterReading:
+    __slots__ = ('timestamp', 'kwh')
+    _ts_cache = {}
+
     def __init__(self, timestamp, kwh):
-        self.timestamp = pd.to_datetime(timestamp)
-        self.kwh = float(kwh)
+        if isinstance(timestamp, pd.Timestamp):
+            ts = timestamp
+        else:
+            ts = MeterReading._ts_cache.get(timestamp)
+            if ts is None:
+                ts = pd.Timestamp(timestamp)
+                MeterReading._ts_cache[timestamp] = ts
+        self.timestamp = ts
+        self.kwh = kwh if type(kwh) is float else float(kwh)
+
+    @classmethod
+    def from_raw(cls, timestamp, kwh):
+        reading = object.__new__(cls)
+        reading.timestamp = timestamp
+        reading.kwh = kwh
+        return reading
     
 class Building:
+    __slots__ = ('name', '_ts', '_kwh', '_size', '_stats_cache')
+
     def __init__(self, name):
         self.name = name
-        self.meter_readings = []
-        self._df = pd.DataFrame() 
+        # Readings live column-wise in growable buffers; only the first _size slots are used
+        self._ts = np.empty(0, dtype='datetime64[ns]')
+        self._kwh = np.empty(0, dtype='f8')
+        self._size = 0
+        self._stats_cache = None
+
+    @property
+    def meter_readings(self):
+        # Read-only snapshot built from the arrays (a tuple); add readings with add_reading
+        timestamps = pd.DatetimeIndex(self._ts[:self._size])
+        return tuple(MeterReading.from_raw(ts, kwh) for ts, kwh in zip(timestamps, self._kwh[:self._size].tolist()))
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= len(self._kwh):
+            return
+        capacity = max(2 * len(self._kwh), needed)
+        ts = np.empty(capacity, dtype='datetime64[ns]')
+        kwh = np.empty(capacity, dtype='f8')
+        ts[:self._size] = self._ts[:self._size]
+        kwh[:self._size] = self._kwh[:self._size]
+        self._ts, self._kwh = ts, kwh
 
     def add_reading(self, reading):
         if isinstance(reading, MeterReading):
-            self.meter_readings.append(reading)
+            self._reserve(1)
+            # Stored as local wall-clock time, like the arrays shared from combined_df
+            self._ts[self._size] = reading.timestamp.tz_localize(None).to_datetime64()
+            self._kwh[self._size] = reading.kwh
+            self._size += 1
+            self._stats_cache = None
         else:
             raise TypeError("Reading must be a MeterReading instance.")
+
+    def _attach(self, timestamps, kwh_values):
+        # Shares existing read-only arrays; capacity equals size, so the next add copies on grow
+        self._ts, self._kwh = timestamps, kwh_values
+        self._size = len(kwh_values)
+        self._stats_cache = None
     
-    def _update_dataframe(self):
-        data = [{'timestamp': r.timestamp, 'kwh': r.kwh} for r in self.meter_readings]
-        if data:
-            self._df = pd.DataFrame(data).set_index('timestamp').sort_index()
-            
+    def _stats(self):
+        # (total, mean, min, max) kWh, computed once and reused until readings change
+        if self._stats_cache is None:
+            kwh = self._kwh[:self._size]
+            # Skip NaN readings (like pandas); the array is only copied if there are any
+            valid = ~np.isnan(kwh)
+            if not valid.all():
+                kwh = kwh[valid]
+            if len(kwh):
+                total = float(kwh.sum())
+                self._stats_cache = (total, total / len(kwh), kwh.min(), kwh.max())
+            else:
+                self._stats_cache = (0.0, np.nan, np.nan, np.nan)
+        return self._stats_cache
+
     def calculate_total_consumption(self):
-        self._update_dataframe()
-        return round(self._df['kwh'].sum(), 2)
+        return round(self._stats()[0], 2)
 
     def generate_report(self):
-        self._update_dataframe()
         total_kwh = self.calculate_total_consumption()
-        summary = self._df['kwh'].agg(mean_kwh='mean', min_kwh='min', max_kwh='max')
+        _, mean_kwh, min_kwh, max_kwh = self._stats()
+        summary = {'mean_kwh': mean_kwh, 'min_kwh': min_kwh, 'max_kwh': max_kwh}
         
         report = (
             f"\n--- Report for Building: {self.name} ---\n"
@@ -49,58 +112,92 @@ class BuildingManager:
     def __init__(self):
         self.buildings = {}
         self.combined_df = pd.DataFrame()
+        self._daily_cache = None
         self.output_dir = 'output' # Define output directory
+        self.cache_dir = None # Parquet cache of combined_df, kept in <data_directory>/cache unless set
+
+    # Ingestion cache: skip CSV parsing when the data files have not changed
+    def _load_cache(self, cache_dir, cache_key):
+        """
+        Restores combined_df and the Building objects from the Parquet cache if it is still
+        valid, and returns the ingest log stored with it (None if the cache can't be used).
+        """
+        cached = load_ingest_cache(cache_dir, cache_key)
+        if cached is None:
+            return None
+        self.combined_df, ingest_log = cached
+        self._share_with_buildings()
+        return ingest_log
+
+    def _share_with_buildings(self):
+        """
+        Points every Building at its block of combined_df's arrays (see split_by_building).
+        Every building category gets a Building, even one without rows, so a cached run
+        has the same buildings as a cold ingest.
+        """
+        self.combined_df, blocks = split_by_building(self.combined_df)
+        for building_name, timestamps, kwh_values in blocks:
+            building_id = building_name.replace('Building ', '', 1)
+            if building_id not in self.buildings:
+                self.buildings[building_id] = Building(building_name)
+            self.buildings[building_id]._attach(timestamps, kwh_values)
+
+    def convert_csvs_to_parquet(self, data_directory='data'):
+        """
+        One-time conversion: writes a zstd-compressed Parquet copy (with parsed timestamps)
+        next to every CSV in data_directory. ingest_data reads these copies instead of the CSVs.
+        """
+        write_parquet_copies(data_directory)
 
     # Data Ingestion (Task 1) - Logic omitted for brevity, assumes success.
     def ingest_data(self, data_directory='data'):
         # ... (Ingestion logic from previous step)
-        all_dfs = []
-        for filename in os.listdir(data_directory):
-            if filename.endswith('.csv'):
-                file_path = os.path.join(data_directory, filename)
-                try:
-                    df = pd.read_csv(file_path, dtype={'kwh': float}, on_bad_lines='skip')
-                    if 'timestamp' in df.columns:
-                        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                        df.dropna(subset=['timestamp', 'kwh'], inplace=True)
-                    else: continue
-                    match = re.search(r'building_([A-Za-z]+)_', filename)
-                    building_id = match.group(1).upper() if match else 'UNKNOWN'
-                    building_name = f'Building {building_id}'
-                    df['building'] = building_name
-                    all_dfs.append(df[['building', 'timestamp', 'kwh']])
-                    
-                    if building_id not in self.buildings:
-                        self.buildings[building_id] = Building(building_name)
-                    building = self.buildings[building_id]
-                    for index, row in df.iterrows():
-                        reading = MeterReading(row['timestamp'], row['kwh'])
-                        building.add_reading(reading)
-                except Exception as e:
-                    print(f"  -- ERROR: Could not process {filename}. Reason: {e}")
-                    continue
-
-        if all_dfs:
-            self.combined_df = pd.concat(all_dfs, ignore_index=True)
-            self.combined_df = self.combined_df.set_index('timestamp').sort_index()
+        cache_dir = self.cache_dir or default_cache_dir(data_directory)
+        cache_key = {'data_directory': os.path.abspath(data_directory), 'files': csv_mtimes(data_directory)}
+        ingest_log = self._load_cache(cache_dir, cache_key)
+        if ingest_log is not None:
+            print_ingest_log(ingest_log, cache_dir)
+            self._daily_cache = None
+            return
+
+        frames, file_buildings, ingest_log = read_meter_frames(data_directory)
+        print_ingest_log(ingest_log)
+
+        # The Building objects are created from combined_df's building categories below
+        if frames:
+            self.combined_df = combine_meter_frames(frames, file_buildings).set_index('timestamp')
+            self._share_with_buildings()
+            save_ingest_cache(cache_dir, cache_key, self.combined_df, ingest_log)
+        self._daily_cache = None
 
     # Aggregation Methods (Task 2)
+    def _compute_daily(self):
+        """Sums combined_df into per-building daily buckets once and memoizes the result."""
+        if self._daily_cache is None:
+            self._daily_cache = bucket_sum(self.combined_df, days_per_bin=1).set_index(['building', 'timestamp'])['kwh']
+        return self._daily_cache
+
     def get_daily_aggregates(self):
         if self.combined_df.empty: return pd.DataFrame()
-        return self.combined_df.groupby('building')['kwh'].resample('D').sum().reset_index().dropna(subset=['kwh'])
+        return self._compute_daily().reset_index()
 
     def get_summary_stats(self):
         """Calculates campus-wide summary stats (Task 2 & 5)."""
         if self.combined_df.empty: return pd.DataFrame()
         
-        # Calculate summary per building
-        summary_df = self.combined_df.groupby('building')['kwh'].agg(
-            total_kwh='sum',
-            mean_kwh='mean',
-            min_kwh='min',
-            max_kwh='max',
-            data_points='count'
-        ).reset_index()
+        # Calculate summary per building from integer building labels
+        labels, buildings = building_labels(self.combined_df['building'])
+        totals, counts, mins, maxs = summarize(
+            self.combined_df['kwh'].to_numpy(dtype=float), labels, len(buildings)
+        )
+        summary_df = pd.DataFrame({
+            'building': buildings,
+            'total_kwh': totals,
+            'mean_kwh': totals / counts,
+            'min_kwh': mins,
+            'max_kwh': maxs,
+            'data_points': counts
+        })
         
         return summary_df
     
@@ -110,11 +207,20 @@ class BuildingManager:
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
             
-        # 1. Export Final Processed Dataset (cleaned_energy_data.csv)
-        cleaned_data_export = self.combined_df.reset_index()
-        cleaned_data_export['month'] = cleaned_data_export['timestamp'].dt.strftime('%B')
-        cleaned_data_export.to_csv(os.path.join(self.output_dir, 'cleaned_energy_data.csv'), index=False)
-        print(f"  -- EXPORT: Final processed dataset saved to {self.output_dir}/cleaned_energy_data.csv")
+        # 1. Export Final Processed Dataset (cleaned_energy_data.parquet)
+        # Parquet keeps dtypes and is columnar; the categorical 'building' column is dictionary-encoded
+        # combined_df is only grouped by building, so sort by time here for the exported file
+        cleaned_data_export = self.combined_df.sort_index(kind='stable').reset_index()
+        cleaned_data_export['month'] = pd.Categorical.from_codes(
+            cleaned_data_export['timestamp'].dt.month.to_numpy() - 1, categories=MONTH_NAMES
+        )
+        cleaned_data_export.to_parquet(
+            os.path.join(self.output_dir, 'cleaned_energy_data.parquet'),
+            engine='pyarrow',
+            compression='snappy',
+            index=False
+        )
+        print(f"  -- EXPORT: Final processed dataset saved to {self.output_dir}/cleaned_energy_data.parquet")
 
         # 2. Export Summary Stats (building_summary.csv)
         summary_stats = self.get_summary_stats()
@@ -138,11 +244,12 @@ class BuildingManager:
         highest_consumer = summary_df.loc[summary_df['total_kwh'].idxmax()]
         
         # 3. Peak Load Time (Approximate using the single highest KWh reading)
+        # (earliest timestamp among equal peaks, independent of combined_df's row order)
         peak_reading = self.combined_df['kwh'].max()
-        peak_timestamp = self.combined_df['kwh'].idxmax()
+        peak_timestamp = self.combined_df.index[self.combined_df['kwh'].to_numpy() == peak_reading].min()
         
         # 4. Weekly/Daily Trends (e.g., Average Daily Consumption)
-        daily_avg_df = self.combined_df.groupby('building')['kwh'].resample('D').sum().groupby('building').mean()
+        daily_avg_df = self._compute_daily().groupby(level=0, observed=True).mean()
         
         report = "="*40 + "\n"
         report += "EXECUTIVE ENERGY CONSUMPTION SUMMARY\n"
@@ -1,15 +1,40 @@
 import pandas as pd
+import numpy as np
 import os
-import re
+from energy_utils import (
+    read_meter_frames, print_ingest_log, combine_meter_frames, split_by_building, bucket_sum,
+    csv_mtimes, default_cache_dir, load_ingest_cache, save_ingest_cache, write_parquet_copies
+)
 
 # --- 1. MeterReading Class ---
 # Represents a single monthly usage record
 class MeterReading:
     """Represents a single meter reading with a timestamp and kWh usage."""
+    # Fixed attribute slots instead of a per-instance __dict__ (smaller, faster attribute access)
+    __slots__ = ('timestamp', 'kwh')
+    # Shared cache of parsed timestamps, keyed by the raw timestamp value
+    _ts_cache = {}
+
     def __init__(self, timestamp, kwh):
         # Ensure kwh is a float and timestamp is a datetime object
-        self.timestamp = pd.to_datetime(timestamp)
-        self.kwh = float(kwh)
+        # (values that already have the right type, e.g. from a datetime64 column, are used as-is)
+        if isinstance(timestamp, pd.Timestamp):
+            ts = timestamp
+        else:
+            ts = MeterReading._ts_cache.get(timestamp)
+            if ts is None:
+                ts = pd.Timestamp(timestamp)
+                MeterReading._ts_cache[timestamp] = ts
+        self.timestamp = ts
+        self.kwh = kwh if type(kwh) is float else float(kwh)
+
+    @classmethod
+    def from_raw(cls, timestamp, kwh):
+        """Creates a reading from an already-parsed Timestamp and float, skipping conversion."""
+        reading = object.__new__(cls)
+        reading.timestamp = timestamp
+        reading.kwh = kwh
+        return reading
     
     def __repr__(self):
         return f"MeterReading(timestamp='{self.timestamp.strftime('%Y-%m-%d')}', kwh={self.kwh})"
@@ -18,55 +43,120 @@ class MeterReading:
 # Manages a building's name and its list of meter readings
 class Building:
     """Represents a building and manages its meter readings."""
+    __slots__ = ('name', '_ts', '_kwh', '_size', '_df', '_dirty', '_stats_cache')
+
     def __init__(self, name):
         self.name = name
-        # Stores a list of MeterReading objects
-        self.meter_readings = []
+        # Stores readings column-wise (structure of arrays) in growable buffers;
+        # only the first self._size slots hold readings
+        self._ts = np.empty(0, dtype='datetime64[ns]')
+        self._kwh = np.empty(0, dtype='f8')
+        self._size = 0
         # Store data in a DataFrame for efficient aggregation (Task 2 logic)
-        self._df = pd.DataFrame() 
+        self._df = None # built on first use by _update_dataframe
+        # True when readings were added since _df was last built
+        self._dirty = True
+        # (total, mean, min, max) of the readings; None until computed or after readings change
+        self._stats_cache = None
+
+    @property
+    def meter_readings(self):
+        """
+        The building's readings as MeterReading objects, built on demand from the arrays.
+        This is a read-only snapshot (a tuple); add readings with add_reading.
+        """
+        timestamps = pd.DatetimeIndex(self._ts[:self._size])
+        return tuple(MeterReading.from_raw(ts, kwh) for ts, kwh in zip(timestamps, self._kwh[:self._size].tolist()))
+
+    def _reserve(self, extra):
+        """Makes room for `extra` more readings, doubling capacity so appends stay amortized O(1)."""
+        needed = self._size + extra
+        if needed <= len(self._kwh):
+            return
+        capacity = max(2 * len(self._kwh), needed)
+        ts = np.empty(capacity, dtype='datetime64[ns]')
+        kwh = np.empty(capacity, dtype='f8')
+        ts[:self._size] = self._ts[:self._size]
+        kwh[:self._size] = self._kwh[:self._size]
+        self._ts, self._kwh = ts, kwh
 
     # Method 1: Add Reading (from Task 3 requirements)
     def add_reading(self, reading):
-        """Adds a MeterReading object to the building's list of readings."""
+        """Adds a MeterReading object to the building's readings."""
         if isinstance(reading, MeterReading):
-            self.meter_readings.append(reading)
+            self._reserve(1)
+            # Stored as local wall-clock time, like the arrays shared from combined_df
+            self._ts[self._size] = reading.timestamp.tz_localize(None).to_datetime64()
+            self._kwh[self._size] = reading.kwh
+            self._size += 1
+            self._dirty = True
+            self._stats_cache = None
         else:
             raise TypeError("Reading must be a MeterReading instance.")
+
+    def _attach(self, timestamps, kwh_values):
+        """Uses existing (shared, read-only) reading arrays as the buffers without copying them."""
+        # Capacity equals size, so the next add goes through _reserve and copies before writing
+        self._ts, self._kwh = timestamps, kwh_values
+        self._size = len(kwh_values)
+        self._dirty = True
+        self._stats_cache = None
     
     # Internal method to update the DataFrame used for aggregation
     def _update_dataframe(self):
-        """Converts meter_readings list into a pandas DataFrame for aggregation."""
-        data = [{'timestamp': r.timestamp, 'kwh': r.kwh} for r in self.meter_readings]
-        if data:
-            self._df = pd.DataFrame(data).set_index('timestamp').sort_index()
+        """Wraps the reading arrays in a pandas DataFrame for aggregation (only when readings changed)."""
+        if not self._dirty:
+            return
+        if self._size:
+            self._df = pd.DataFrame(
+                {'kwh': self._kwh[:self._size]},
+                index=pd.DatetimeIndex(self._ts[:self._size], name='timestamp')
+            ).sort_index(kind='stable')
+        self._dirty = False
             
+    def _stats(self):
+        """Returns (total, mean, min, max) kWh, computed once and reused until readings change."""
+        if self._stats_cache is None:
+            kwh = self._kwh[:self._size]
+            # Skip NaN readings (like pandas); the array is only copied if there are any
+            valid = ~np.isnan(kwh)
+            if not valid.all():
+                kwh = kwh[valid]
+            if len(kwh):
+                total = float(kwh.sum())
+                self._stats_cache = (total, total / len(kwh), kwh.min(), kwh.max())
+            else:
+                self._stats_cache = (0.0, np.nan, np.nan, np.nan)
+        return self._stats_cache
+
     # Method 2: Calculate Total Consumption (from Task 3 requirements)
     def calculate_total_consumption(self):
         """Calculates the total kWh consumption for the building."""
-        self._update_dataframe()
-        if self._df.empty:
-            return 0.0
-        return round(self._df['kwh'].sum(), 2)
+        return round(self._stats()[0], 2)
 
     # Method 3: Generate Report (from Task 3 requirements)
     def generate_report(self):
         """Generates a summary report for the building (Task 3 Expected Output)."""
         total_kwh = self.calculate_total_consumption()
         
-        # Calculate summary statistics (Task 2 logic)
-        summary = self._df['kwh'].agg(mean_kwh='mean', min_kwh='min', max_kwh='max')
+        # Summary statistics (Task 2 logic) come from the same cached pass as the total
+        _, mean_kwh, min_kwh, max_kwh = self._stats()
+        summary = {'mean_kwh': mean_kwh, 'min_kwh': min_kwh, 'max_kwh': max_kwh}
         
         report = (
             f"\n--- Report for Building: {self.name} ---\n"
-            f"Total Months of Data: {len(self.meter_readings)}\n"
+            f"Total Months of Data: {self._size}\n"
             f"Total Consumption (kWh): {total_kwh}\n"
             f"Mean Consumption (kWh): {summary['mean_kwh']:.2f}\n"
             f"Min Consumption (kWh): {summary['min_kwh']:.2f}\n"
             f"Max Consumption (kWh): {summary['max_kwh']:.2f}\n"
             "Monthly Readings:\n"
         )
-        for reading in sorted(self.meter_readings, key=lambda r: r.timestamp):
-            report += f"  - {reading.timestamp.strftime('%Y-%m')}: {reading.kwh} kWh\n"
+        # Format the (time-sorted) readings from _df: strftime runs once over the whole index
+        if self._size:
+            self._update_dataframe()
+            months = self._df.index.strftime('%Y-%m')
+            report += ''.join(f"  - {month}: {kwh} kWh\n" for month, kwh in zip(months, self._df['kwh'].tolist()))
         return report
 
 # --- 3. BuildingManager Class ---
@@ -77,60 +167,70 @@ class BuildingManager:
         # Dictionary to store Building objects: {ID: Building_instance}
         self.buildings = {}
         self.combined_df = pd.DataFrame()
+        self.cache_dir = None # Parquet cache of combined_df, kept in <data_directory>/cache unless set
+
+    def _load_cache(self, cache_dir, cache_key):
+        """
+        Restores combined_df and the Building objects from the Parquet cache if it is still
+        valid, and returns the ingest log stored with it (None if the cache can't be used).
+        """
+        cached = load_ingest_cache(cache_dir, cache_key)
+        if cached is None:
+            return None
+        self.combined_df, ingest_log = cached
+        self._share_with_buildings()
+        return ingest_log
+
+    def _share_with_buildings(self):
+        """
+        Points every Building at its contiguous block of combined_df's arrays (see
+        split_by_building), so readings are stored once. Building sorts its own
+        readings by time when it builds _df. Every building category gets a Building,
+        even one without rows, so a cached run has the same buildings as a cold ingest.
+        """
+        self.combined_df, blocks = split_by_building(self.combined_df)
+        for building_name, timestamps, kwh_values in blocks:
+            building_id = building_name.replace('Building ', '', 1)
+            if building_id not in self.buildings:
+                self.buildings[building_id] = Building(building_name)
+            self.buildings[building_id]._attach(timestamps, kwh_values)
+
+    def convert_csvs_to_parquet(self, data_directory='data'):
+        """
+        One-time conversion: writes a zstd-compressed Parquet copy (with parsed timestamps)
+        next to every CSV in data_directory. ingest_data reads these copies instead of the CSVs.
+        """
+        write_parquet_copies(data_directory)
 
     # Method 4: Ingest Data (incorporates Task 1 logic)
     def ingest_data(self, data_directory='data'):
         """Reads multiple CSV files and populates the Building objects."""
-        all_dfs = []
-        
-        for filename in os.listdir(data_directory):
-            if filename.endswith('.csv'):
-                file_path = os.path.join(data_directory, filename)
-                
-                try:
-                    df = pd.read_csv(file_path, dtype={'kwh': float}, on_bad_lines='skip')
-                    
-                    # Robust Timestamp Conversion (Task 1 logic)
-                    if 'timestamp' in df.columns:
-                        original_len = len(df)
-                        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                        df.dropna(subset=['timestamp', 'kwh'], inplace=True)
-                        if len(df) < original_len:
-                            print(f"  -- LOG: Dropped {original_len - len(df)} bad row(s) in {filename}.")
-                    else:
-                        continue 
-                    
-                    # Extract building ID
-                    match = re.search(r'building_([A-Za-z]+)_', filename)
-                    building_id = match.group(1).upper() if match else 'UNKNOWN'
-                    building_name = f'Building {building_id}'
-                    df['building'] = building_name
-                    
-                    all_dfs.append(df[['building', 'timestamp', 'kwh']])
-                    
-                    # Create or GET the existing Building object
-                    if building_id not in self.buildings:
-                        self.buildings[building_id] = Building(building_name)
-                    building = self.buildings[building_id]
-
-                    # Populate the Building object with MeterReading instances
-                    for index, row in df.iterrows():
-                        reading = MeterReading(row['timestamp'], row['kwh'])
-                        building.add_reading(reading)
-
-                except Exception as e:
-                    print(f"  -- ERROR: Could not process {filename}. Reason: {e}")
-                    continue
-
-        if all_dfs:
-            self.combined_df = pd.concat(all_dfs, ignore_index=True)
-            self.combined_df = self.combined_df.set_index('timestamp').sort_index()
+        # Reuse the ingested data from a previous run while the CSV files are unchanged
+        # (shared with the dashboard and final report scripts)
+        cache_dir = self.cache_dir or default_cache_dir(data_directory)
+        cache_key = {'data_directory': os.path.abspath(data_directory), 'files': csv_mtimes(data_directory)}
+        ingest_log = self._load_cache(cache_dir, cache_key)
+        if ingest_log is not None:
+            print_ingest_log(ingest_log, cache_dir)
+            return
+
+        # Robust Timestamp Cleanup (Task 1 logic) happens while reading: rows with an
+        # invalid timestamp or kWh value are dropped and logged per file
+        frames, file_buildings, ingest_log = read_meter_frames(data_directory)
+        print_ingest_log(ingest_log)
+
+        # Create or GET the Building object of every ingested file (one per building
+        # category of combined_df) and attach its readings
+        if frames:
+            self.combined_df = combine_meter_frames(frames, file_buildings).set_index('timestamp')
+            self._share_with_buildings()
+            save_ingest_cache(cache_dir, cache_key, self.combined_df, ingest_log)
 
     # Aggregation method (Task 2 logic moved to Manager for central control)
     def get_daily_aggregates(self):
         """Calculates and returns the total daily electricity consumption per building."""
         if self.combined_df.empty: return pd.DataFrame()
-        return self.combined_df.groupby('building')['kwh'].resample('D').sum().reset_index().dropna(subset=['kwh'])
+        return bucket_sum(self.combined_df, days_per_bin=1)
 
 
 # --- Execution ---